@@ -3,16 +3,21 @@ package com.aiops.aiops_api.controller;
 import com.aiops.aiops_api.service.MetricsService;
 import com.aiops.aiops_api.service.ConfigService;
 import org.springframework.beans.factory.annotation.Autowired;
+import org.springframework.http.ResponseEntity;
 import org.springframework.web.bind.annotation.*;
 
 import java.util.List;
 import java.util.Map;
+import java.util.Set;
 
 @RestController
 @RequestMapping("/api")
 @CrossOrigin(origins = "*") // Important for the Vue.js frontend
 public class ApiController {
 
+    private static final Set<String> ROLLUP_WINDOWS = Set.of("1m", "1h");
+    private static final Set<String> ROLLUP_FIELDS = Set.of("min", "mean", "max", "p95");
+
     @Autowired
     private MetricsService metricsService;
 
@@ -24,6 +29,19 @@ public class ApiController {
         return metricsService.getLiveMetrics();
     }
 
+    // Long-range history served from the rollups, e.g. /api/metrics/history?window=1h&range=-24h&field=p95
+    @GetMapping("/metrics/history")
+    public ResponseEntity<?> getMetricHistory(
+            @RequestParam(defaultValue = "1m") String window,
+            @RequestParam(defaultValue = "-1h") String range,
+            @RequestParam(defaultValue = "mean") String field) {
+        // Values end up in a Flux query, so only a fixed set is accepted
+        if (!ROLLUP_WINDOWS.contains(window) || !ROLLUP_FIELDS.contains(field) || !range.matches("-\\d+[mhd]")) {
+            return ResponseEntity.badRequest().body(Map.of("error", "invalid window, range or field"));
+        }
+        return ResponseEntity.ok(metricsService.getMetricHistory(window, range, field));
+    }
+
     @GetMapping("/planning")
     public Map<String, String> getPlanning() {
         return Map.of("response", metricsService.getLatestLlmPlanner());
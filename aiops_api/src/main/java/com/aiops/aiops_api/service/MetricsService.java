@@ -18,6 +18,10 @@ public class MetricsService {
     @Value("${influx.bucket}")
     private String bucket;
 
+    // Measurement written by the rollup service (1m and 1h min/mean/max/p95 per series)
+    @Value("${influx.rollup-measurement:mqtt_consumer_rollup}")
+    private String rollupMeasurement;
+
     // QUERY 1: Real-time Metrics (DYNAMIC & DATA-DRIVEN)
     public List<Map<String, Object>> getLiveMetrics() {
         String query = String.format("""
@@ -83,4 +87,37 @@ public class MetricsService {
         }
         return "Waiting for LLM analysis...";
     }
+
+    // QUERY 3: Metric History (reads the pre-aggregated rollups, never the raw samples)
+    public List<Map<String, Object>> getMetricHistory(String window, String range, String field) {
+        String query = String.format("""
+            from(bucket: "%s")
+              |> range(start: %s)
+              |> filter(fn: (r) => r["_measurement"] == "%s")
+              |> filter(fn: (r) => r["window"] == "%s")
+              |> filter(fn: (r) => r["_field"] == "%s")
+              |> keep(columns: ["_time", "cluster", "container", "metric", "_value"])
+              |> pivot(rowKey:["_time", "cluster", "container"], columnKey: ["metric"], valueColumn: "_value")
+            """, bucket, range, rollupMeasurement, window, field);
+
+        List<FluxTable> tables = influxDBClient.getQueryApi().query(query);
+        List<Map<String, Object>> results = new ArrayList<>();
+
+        for (FluxTable table : tables) {
+            for (FluxRecord record : table.getRecords()) {
+                Map<String, Object> data = new HashMap<>();
+                data.put("time", record.getTime() != null ? record.getTime().toString() : null);
+
+                // Same filtering as the live metrics: only cluster, container and metric columns
+                for (Map.Entry<String, Object> entry : record.getValues().entrySet()) {
+                    String key = entry.getKey();
+                    if (!key.startsWith("_") && !key.equals("result") && !key.equals("table")) {
+                        data.put(key, entry.getValue());
+                    }
+                }
+                results.add(data);
+            }
+        }
+        return results;
+    }
 }
\ No newline at end of file
@@ -2,6 +2,8 @@ import os
 import time
 import json
 import configparser
+import profiling
+import flow_control
 import paho.mqtt.client as mqtt
 from influxdb_client import InfluxDBClient
 
@@ -23,9 +25,20 @@ INFLUX_ORG = os.environ.get("INFLUXDB_ORG")
 INFLUX_BUCKET = os.environ.get("INFLUXDB_BUCKET")
 
 ANALYZER_INTERVAL = int(config["general"]["analyzer_interval"])
+PUBLISH_INTERVAL = int(config["general"]["publish_interval"])
+TELEGRAF_FLUSH_INTERVAL = config.getint("general", "telegraf_flush_interval", fallback=10)
+
+# Flow control: back off while the planner reports saturation
+STATUS_TIMEOUT = config.getint("flow_control", "status_timeout", fallback=30)
+MAX_BACKOFF = config.getint("flow_control", "analyzer_max_backoff", fallback=4)
+# In delta mode, every Nth report is a full one: a container that stays anomalous is re-sent
+# even if its previous report or command was dropped downstream as stale
+FULL_REPORT_EVERY = config.getint("flow_control", "analyzer_full_report_every", fallback=3)
 
 # Dynamic Configuration Loading
 METRIC_RULES = {} 
+# Longest gap between two points of the same series (deadband heartbeat), in ticks
+MAX_HEARTBEAT_TICKS = 1
 
 try:
     enabled_metrics_str = config["general"]["metrics"]
@@ -38,14 +51,21 @@ try:
             if threshold:
                 METRIC_RULES[metric] = float(threshold)
                 print(f"[Config] Monitoring '{metric}': threshold {threshold}")
+            heartbeat_ticks = int(config[section_name].get("heartbeat_ticks", 1))
+            MAX_HEARTBEAT_TICKS = max(MAX_HEARTBEAT_TICKS, heartbeat_ticks)
 except Exception as e:
     print(f"[Config] Error loading metric rules: {e}")
 
+# With deadband publishing, an unchanged series only gets a point every heartbeat,
+# so the last value can be older than one minute. Ticks drift past PUBLISH_INTERVAL and
+# Telegraf stamps points on arrival, so we look back one heartbeat, two ticks and a flush.
+LOOKBACK_SECONDS = max(60, (MAX_HEARTBEAT_TICKS + 2) * PUBLISH_INTERVAL + TELEGRAF_FLUSH_INTERVAL)
+
 def collect_metrics(query_api) -> dict:
     metrics = {}
     query = f'''
     from(bucket: "{INFLUX_BUCKET}")
-    |> range(start: -1m)
+    |> range(start: -{LOOKBACK_SECONDS}s)
     |> filter(fn: (r) =>
         r._measurement == "mqtt_consumer" and
         r._field == "value"
@@ -116,12 +136,24 @@ def evaluate_metrics(metrics: dict) -> dict:
                 }
     return report
 
+def report_delta(report: dict, previous: dict) -> dict:
+    # Only the containers whose state changed since the last published report
+    delta = {}
+    for cluster, containers in report.items():
+        for container, state in containers.items():
+            old_state = previous.get(cluster, {}).get(container)
+            if not old_state or old_state["severity"] != state["severity"] or old_state["dominant_metric"] != state["dominant_metric"]:
+                delta.setdefault(cluster, {})[container] = state
+    return delta
+
 # Connection Setup
 while True:
     try:
         client = mqtt.Client()
         client.username_pw_set(MQTT_USER, MQTT_PASSWORD)
         client.connect(MQTT_BROKER, MQTT_PORT, 60)
+        profiling.attach(client, "analyzer")
+        planner_status = flow_control.watch(client, "planner", STATUS_TIMEOUT)
         client.loop_start()
         print("[Analyzer] MQTT ready")
         break
@@ -142,18 +174,52 @@ while True:
 
 print(f"[Analyzer] Started monitoring. Interval: {ANALYZER_INTERVAL}s")
 
+backoff = 1
+last_report = {}
+delta_reports = 0
+
 while True:
+    # While the planner is saturated we stretch the cadence and only send what changed
+    planner_saturated = bool(planner_status.saturated_stages())
+    if planner_saturated:
+        backoff = min(backoff * 2, MAX_BACKOFF)
+    else:
+        backoff = 1
+
     current_metrics = collect_metrics(query_api)
+    reported_clusters = 0
+    send_delta = False
     if current_metrics:
         analysis_report = evaluate_metrics(current_metrics)
+        send_delta = planner_saturated and delta_reports < FULL_REPORT_EVERY - 1
+        if send_delta:
+            anomalies = report_delta(analysis_report, last_report)
+            delta_reports += 1
+        else:
+            anomalies = analysis_report
+            delta_reports = 0
+        last_report = analysis_report
         
         client.publish(
             MQTT_TOPIC,
             json.dumps({
                 "timestamp": time.time(),
-                "anomalies": analysis_report
+                "anomalies": anomalies,
+                "delta": send_delta
             })
         )
-        print(f"[Analyzer] Report published for {len(analysis_report)} clusters")
+        reported_clusters = len(anomalies)
+        if send_delta:
+            print(f"[Analyzer] Planner saturated: delta report published for {reported_clusters} clusters, next in {ANALYZER_INTERVAL * backoff}s")
+        else:
+            print(f"[Analyzer] Report published for {reported_clusters} clusters")
+
+    flow_control.publish_status(
+        client, "analyzer", False,
+        interval=ANALYZER_INTERVAL * backoff,
+        backoff=backoff,
+        delta=int(send_delta),
+        reported_clusters=reported_clusters
+    )
     
-    time.sleep(ANALYZER_INTERVAL)
\ No newline at end of file
+    time.sleep(ANALYZER_INTERVAL * backoff)
\ No newline at end of file
@@ -0,0 +1,52 @@
+import json
+import time
+import threading
+
+# Pipeline flow control.
+# Every consumer publishes a small heartbeat on AIops/status/<stage>:
+#   {"timestamp": ..., "stage": "planner", "queue_depth": 3, "lag": 1.2, "saturated": 0, ...}
+# Producers subscribe to the stage after them and slow down while it reports saturation.
+# "saturated" is 0/1 rather than a boolean so Telegraf stores it as a numeric field.
+
+STATUS_TOPIC = "AIops/status"
+
+def publish_status(client, stage, saturated, **fields):
+    payload = {"timestamp": time.time(), "stage": stage, "saturated": int(bool(saturated))}
+    payload.update(fields)
+    client.publish(f"{STATUS_TOPIC}/{stage}", json.dumps(payload))
+
+class StatusTracker:
+    # Keeps the latest heartbeat of the watched stages. A heartbeat older than
+    # `timeout` is ignored, so a stage that went silent never blocks its producer forever.
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.latest = {}
+
+    def on_status_message(self, client, userdata, msg):
+        try:
+            status = json.loads(msg.payload.decode())
+            with self.lock:
+                self.latest[status["stage"]] = (time.time(), status)
+        except Exception as e:
+            print(f"[Flow Control] Error reading status: {e}")
+
+    def fresh(self):
+        now = time.time()
+        with self.lock:
+            return {
+                stage: status
+                for stage, (received, status) in self.latest.items()
+                if now - received <= self.timeout
+            }
+
+    def saturated_stages(self):
+        return sorted(stage for stage, status in self.fresh().items() if status.get("saturated"))
+
+def watch(client, stage, timeout):
+    # Subscribes an already connected client to the heartbeats of `stage` and of its sub-stages (shards)
+    tracker = StatusTracker(timeout)
+    topic = f"{STATUS_TOPIC}/{stage}/#"
+    client.subscribe(topic)
+    client.message_callback_add(topic, tracker.on_status_message)
+    return tracker
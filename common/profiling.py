@@ -0,0 +1,206 @@
+import os
+import sys
+import json
+import time
+import threading
+import tracemalloc
+from collections import Counter
+
+# On-demand profiling driven over MQTT.
+# Command payload published on CONTROL_TOPIC:
+#   {"service": "analyzer", "action": "start", "mode": "wall", "duration": 30, "top": 10}
+#   {"service": "analyzer", "action": "stop"}
+# "service" is a service name, a prefix like "managed_resources" (matches every shard) or "*".
+# "mode" is "wall" (wall-clock stack sampling of every thread, collapsed-stack output)
+# or "memory" (tracemalloc snapshot diff between start and stop).
+# Wall-clock samples include blocked threads: a frame waiting on a lock, a sleep or a
+# socket counts as much as one running code, so the summary reports idle and busy frames alike.
+
+CONTROL_TOPIC = "AIops/control/profile"
+RESULT_TOPIC = "AIops/control/profile/result"
+
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "/tmp/profiles")
+MAX_DURATION = int(os.environ.get("PROFILE_MAX_DURATION", 300))
+DEFAULT_DURATION = 30
+DEFAULT_TOP = 10
+SAMPLE_INTERVAL = 0.01  # 100 Hz
+TRACEMALLOC_FRAMES = 25
+# Threads started by the profiler itself are named with this prefix and never sampled
+THREAD_PREFIX = "profiler-"
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class Profiler:
+    def __init__(self, client, service):
+        self.client = client
+        self.service = service
+        self.lock = threading.Lock()
+        self.session = None
+
+    def matches(self, target):
+        return target in ("*", self.service) or self.service.startswith(f"{target}/")
+
+    def on_control_message(self, client, userdata, msg):
+        try:
+            command = json.loads(msg.payload.decode())
+            if not self.matches(command.get("service", "")):
+                return
+
+            action = command.get("action")
+            if action == "start":
+                duration = float(command.get("duration", DEFAULT_DURATION))
+                if duration <= 0:
+                    self.publish_result({"status": "error", "error": f"duration must be positive, got {duration}"})
+                    return
+                self.start(
+                    command.get("mode", "wall"),
+                    min(duration, MAX_DURATION),
+                    int(command.get("top", DEFAULT_TOP))
+                )
+            elif action == "stop":
+                # Writing results can take a while for large heaps, keep the MQTT thread free
+                threading.Thread(target=self.stop, args=(True,), name=f"{THREAD_PREFIX}stop", daemon=True).start()
+            else:
+                self.publish_result({"status": "error", "error": f"unknown action '{action}'"})
+        except Exception as e:
+            print(f"[Profiler {self.service}] Error handling command: {e}")
+            self.publish_result({"status": "error", "error": f"invalid command: {e}"})
+
+    def start(self, mode, duration, top):
+        with self.lock:
+            if self.session:
+                self.publish_result({"status": "error", "error": f"{self.session['mode']} profiling already running"})
+                return
+            if mode not in ("wall", "memory"):
+                self.publish_result({"status": "error", "error": f"unknown mode '{mode}'"})
+                return
+
+            self.session = {"mode": mode, "top": top, "started": time.time()}
+            if mode == "wall":
+                self.session["stacks"] = Counter()
+                self.session["running"] = threading.Event()
+                self.session["running"].set()
+                self.session["sampler"] = threading.Thread(
+                    target=self._sample_loop, args=(self.session,), name=f"{THREAD_PREFIX}sampler", daemon=True
+                )
+                self.session["sampler"].start()
+            else:
+                self.session["was_tracing"] = tracemalloc.is_tracing()
+                if not self.session["was_tracing"]:
+                    tracemalloc.start(TRACEMALLOC_FRAMES)
+                self.session["baseline"] = tracemalloc.take_snapshot()
+
+            # Bounded duration: the session always stops on its own
+            timer = threading.Timer(duration, self.stop)
+            timer.name = f"{THREAD_PREFIX}timer"
+            timer.daemon = True
+            timer.start()
+            self.session["timer"] = timer
+
+        print(f"[Profiler {self.service}] Started {mode} profiling for {duration:.0f}s")
+        self.publish_result({"status": "started", "mode": mode, "duration": duration})
+
+    def stop(self, requested=False):
+        with self.lock:
+            session = self.session
+            self.session = None
+        if not session:
+            # The timer firing after a manual stop is expected, an explicit stop deserves an answer
+            if requested:
+                self.publish_result({"status": "error", "error": "no profiling session running"})
+            return
+
+        session["timer"].cancel()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.gmtime(session["started"]))
+        base_name = os.path.join(PROFILE_DIR, f"{self.service.replace('/', '_')}-{session['mode']}-{stamp}")
+
+        try:
+            if session["mode"] == "wall":
+                session["running"].clear()
+                session["sampler"].join()
+                path, summary = self._write_wall(session, base_name)
+            else:
+                path, summary = self._write_memory(session, base_name)
+        except Exception as e:
+            print(f"[Profiler {self.service}] Error writing results: {e}")
+            self.publish_result({"status": "error", "mode": session["mode"], "error": str(e)})
+            return
+
+        print(f"[Profiler {self.service}] Results written to {path}")
+        self.publish_result({
+            "status": "done",
+            "mode": session["mode"],
+            "duration": round(time.time() - session["started"], 1),
+            "file": path,
+            "top": summary
+        })
+
+    def _sample_loop(self, session):
+        while session["running"].is_set():
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                # Skip the sampler, the session timer and stop workers
+                if names.get(thread_id, "").startswith(THREAD_PREFIX):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                session["stacks"][";".join(reversed(stack))] += 1
+            time.sleep(SAMPLE_INTERVAL)
+
+    def _write_wall(self, session, base_name):
+        stacks = session["stacks"]
+        path = f"{base_name}.collapsed"
+        # Collapsed-stack format, one "frame;frame;frame count" per line (flamegraph.pl / speedscope)
+        with open(path, "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        # Summary: functions where the samples were taken (wall-clock, blocked frames included)
+        leaves = Counter()
+        for stack, count in stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        summary = [
+            {"frame": frame, "samples": count, "wall_percent": round(100 * count / total, 1)}
+            for frame, count in leaves.most_common(session["top"])
+        ]
+        return path, summary
+
+    def _write_memory(self, session, base_name):
+        snapshot = tracemalloc.take_snapshot()
+        if not session["was_tracing"]:
+            tracemalloc.stop()
+
+        path = f"{base_name}.txt"
+        diff = snapshot.compare_to(session["baseline"], "lineno")
+        with open(path, "w") as f:
+            for stat in diff:
+                f.write(f"{stat}\n")
+
+        summary = [
+            {
+                "location": str(stat.traceback[0]),
+                "size_diff_kb": round(stat.size_diff / 1024, 1),
+                "size_kb": round(stat.size / 1024, 1),
+                "count_diff": stat.count_diff
+            }
+            for stat in diff[:session["top"]]
+        ]
+        return path, summary
+
+    def publish_result(self, result):
+        result.update({"timestamp": time.time(), "service": self.service})
+        self.client.publish(RESULT_TOPIC, json.dumps(result))
+
+def attach(client, service):
+    # Subscribes an already connected client to the profiling control topic
+    profiler = Profiler(client, service)
+    client.subscribe(CONTROL_TOPIC)
+    client.message_callback_add(CONTROL_TOPIC, profiler.on_control_message)
+    return profiler
@@ -1,17 +1,39 @@
 import os
 import time
 import json
+import threading
+import configparser
+import profiling
+import flow_control
 import paho.mqtt.client as mqtt
 
 # Config parsing
+config = configparser.ConfigParser(interpolation=None)
+config.read("config.ini")
+
 MQTT_BROKER = os.environ.get("MQTT_BROKER", "mosquitto")
 MQTT_PORT = int(os.environ.get("MQTT_PORT", 1883))
 MQTT_USER = os.getenv("MQTT_EXECUTOR_USER")
 MQTT_PASSWORD = os.getenv("MQTT_EXECUTOR_PASSWORD")
 
 PLANNER_TOPIC = "AIops/planner"
+# Commands go to AIops/execute/cluster_{id}, so each simulator shard only receives its own clusters
 EXECUTE_TOPIC = "AIops/execute"
 
+# Flow control settings
+STATUS_TIMEOUT = config.getint("flow_control", "status_timeout", fallback=30)
+MAX_PLAN_AGE = config.getint("flow_control", "max_plan_age", fallback=30)
+MAX_COMMANDS_PER_SECOND = config.getint("flow_control", "executor_max_commands_per_second", fallback=1)
+STATUS_INTERVAL = 5
+
+# Commands waiting to be dispatched, one per (cluster, container): a newer plan replaces an older command
+pending_commands = {}
+pending_lock = threading.Lock()
+
+# Counters reported in the executor heartbeat
+flow_stats = {"lag": 0.0, "published": 0, "stale": 0, "replaced": 0, "held_ticks": 0}
+simulator_status = None
+
 # Helper functions
 def parse_cluster_id(cluster_str: str) -> int:
     # 'cluster_0' -> 0
@@ -35,25 +57,80 @@ def on_message(client, userdata, msg):
             print("[Executor] No actions received")
             return
 
-        for action in actions:
-            # Normalization
-            cluster_id = parse_cluster_id(action["cluster"])
-            container_name = parse_container_name(action["container"])
+        # Age is measured from the analyzer report the plan was built on
+        report_timestamp = payload.get("report_timestamp", payload.get("timestamp", time.time()))
 
-            command = {
-                "timestamp": time.time(),
-                "cluster": cluster_id,        # Integer id ready
-                "container": container_name,  # Name without the prefix "container_"
-                "action": action["action"]
-            }
+        with pending_lock:
+            for action in actions:
+                # Normalization
+                cluster_id = parse_cluster_id(action["cluster"])
+                container_name = parse_container_name(action["container"])
 
-            client.publish(EXECUTE_TOPIC, json.dumps(command))
+                key = (cluster_id, container_name)
+                if key in pending_commands:
+                    flow_stats["replaced"] += 1
+                pending_commands[key] = {
+                    "report_timestamp": report_timestamp,
+                    "cluster": cluster_id,        # Integer id ready
+                    "container": container_name,  # Name without the prefix "container_"
+                    "action": action["action"]
+                }
 
-            print(f"[Executor] Published command: {command}")
+        print(f"[Executor] Queued {len(actions)} commands, {len(pending_commands)} pending")
 
     except Exception as e:
         print(f"[Executor] Error processing message: {e}")
 
+def saturated_clusters() -> dict:
+    # cluster id -> saturated simulator shard owning it
+    held = {}
+    statuses = simulator_status.fresh() if simulator_status else {}
+    for stage, status in statuses.items():
+        if status.get("saturated"):
+            for cid in str(status.get("clusters", "")).split(","):
+                if cid.strip().isdigit():
+                    held[int(cid)] = stage
+    return held
+
+# Dispatch: at most MAX_COMMANDS_PER_SECOND commands, none for the clusters of a saturated shard
+def dispatch_pending(client):
+    # A shard is behind on its commands: hold ours for its clusters until it catches up
+    held = saturated_clusters()
+
+    with pending_lock:
+        now = time.time()
+        # Acting on an old analysis could undo what newer metrics already show
+        for key, command in list(pending_commands.items()):
+            if now - command["report_timestamp"] > MAX_PLAN_AGE:
+                del pending_commands[key]
+                flow_stats["stale"] += 1
+                print(f"[Executor] Dropping stale command for {key} ({now - command['report_timestamp']:.1f}s old)")
+
+        held_keys = [key for key in pending_commands if key[0] in held]
+        if held_keys:
+            flow_stats["held_ticks"] += 1
+            shards = sorted({held[key[0]] for key in held_keys})
+            print(f"[Executor] Managed resources saturated ({', '.join(shards)}). Holding {len(held_keys)} commands")
+
+        # Oldest analysis first
+        ready = [item for item in pending_commands.items() if item[0][0] not in held]
+        batch = sorted(ready, key=lambda item: item[1]["report_timestamp"])[:MAX_COMMANDS_PER_SECOND]
+        for key, pending in batch:
+            del pending_commands[key]
+            lag = now - pending["report_timestamp"]
+            flow_stats["lag"] = round(lag, 2)
+
+            command = {
+                "timestamp": now,
+                "cluster": pending["cluster"],
+                "container": pending["container"],
+                "action": pending["action"]
+            }
+            client.publish(f"{EXECUTE_TOPIC}/cluster_{pending['cluster']}", json.dumps(command))
+            flow_stats["published"] += 1
+
+            print(f"[Executor] Published command: {command}")
+
 # Main Loop
 if __name__ == "__main__":
     while True:
@@ -63,6 +140,8 @@ if __name__ == "__main__":
             client.connect(MQTT_BROKER, MQTT_PORT, 60)
             client.subscribe(PLANNER_TOPIC)
             client.on_message = on_message
+            profiling.attach(client, "executor")
+            simulator_status = flow_control.watch(client, "managed_resources", STATUS_TIMEOUT)
             client.loop_start()
             print("[Executor] MQTT ready")
             break
@@ -72,5 +151,23 @@ if __name__ == "__main__":
 
     print("[Executor] Started")
 
+    last_status = 0
     while True:
+        dispatch_pending(client)
+
+        if time.time() - last_status >= STATUS_INTERVAL:
+            with pending_lock:
+                pending = len(pending_commands)
+            flow_control.publish_status(
+                client, "executor",
+                pending > MAX_COMMANDS_PER_SECOND * STATUS_INTERVAL,
+                queue_depth=pending,
+                lag=flow_stats["lag"],
+                published=flow_stats["published"],
+                stale=flow_stats["stale"],
+                replaced=flow_stats["replaced"],
+                held_ticks=flow_stats["held_ticks"]
+            )
+            last_status = time.time()
+
         time.sleep(1)
\ No newline at end of file
@@ -1,7 +1,12 @@
 import os
+import sys
 import time
 import json
+import signal
 import configparser
+import multiprocessing
+import profiling
+import flow_control
 import paho.mqtt.client as mqtt
 
 from queue import Queue
@@ -21,8 +26,18 @@ NUM_CONTAINERS = int(config["general"]["num_containers"])
 NUM_CLUSTERS = int(config["general"]["num_clusters"])
 
 PUBLISH_INTERVAL = int(config["general"]["publish_interval"])
+# Commands are published per cluster: AIops/execute/cluster_{id}
 EXECUTE_TOPIC = "AIops/execute"
 
+# Number of worker processes the clusters are split across (1 = single process, no supervisor)
+SIMULATOR_SHARDS = max(1, min(NUM_CLUSTERS, config.getint("general", "simulator_shards", fallback=1)))
+# A shard that has not completed a tick for this long is considered stuck and restarted
+SHARD_HEALTH_TIMEOUT = 3 * PUBLISH_INTERVAL + 30
+
+# Flow control: commands wait at most one tick in a healthy shard. A shard whose ticks overrun
+# falls behind, and its commands grow older than this before they are applied
+MAX_COMMAND_LAG = config.getint("flow_control", "simulator_max_command_lag", fallback=2 * PUBLISH_INTERVAL)
+
 # Dynamic Metrics Configuration Loading 
 try:
     enabled_metrics_str = config["general"]["metrics"]
@@ -60,94 +75,222 @@ for metric in ENABLED_METRICS:
             'scale_up_delta': 0.0, 'scale_down_delta': 0.0
         }
 
-# Simulation state initialization
-containers = []
-for i in range(NUM_CONTAINERS):
-    section = f"container_{i}"
-    name = config[section]["name"]
-    cluster_id = int(config[section]["cluster"])
-    containers.append(Container(name, cluster_id, METRIC_CONFIGS))
-
-clusters = {
-    cid: Cluster(
-        cluster_id=cid,
-        containers=[c for c in containers if c.cluster_id == cid]
+# Simulation state initialization (only the clusters owned by this process)
+def build_clusters(cluster_ids):
+    containers = []
+    for i in range(NUM_CONTAINERS):
+        section = f"container_{i}"
+        name = config[section]["name"]
+        cluster_id = int(config[section]["cluster"])
+        if cluster_id in cluster_ids:
+            containers.append(Container(name, cluster_id, METRIC_CONFIGS))
+
+    return {
+        cid: Cluster(
+            cluster_id=cid,
+            containers=[c for c in containers if c.cluster_id == cid]
+        )
+        for cid in cluster_ids
+    }
+
+# Deadband compression: a metric is only republished when it moved enough,
+# or when its heartbeat is due so consumers can tell "unchanged" from "dead"
+def should_publish(metric_name, value, last, tick):
+    if last is None:
+        return True
+    last_value, last_tick = last
+    cfg = METRIC_CONFIGS[metric_name]
+
+    if tick - last_tick >= int(cfg.get("heartbeat_ticks", 1)):
+        return True
+
+    delta = abs(value - last_value)
+    deadband_abs = float(cfg.get("deadband_abs", 0))
+    deadband_rel = float(cfg.get("deadband_rel", 0))
+
+    # With no deadband configured, any change is published
+    if deadband_abs <= 0 and deadband_rel <= 0:
+        return delta > 0
+    if deadband_abs > 0 and delta > deadband_abs:
+        return True
+    if deadband_rel > 0 and delta > deadband_rel * abs(last_value):
+        return True
+    return False
+
+def publish_container(client, cluster, container, timestamp, last_published, tick, force=False):
+    topic_base = f"AIops/metrics/cluster_{cluster.cluster_id}/container_{container.name}/"
+    for metric_name, value in container.metrics.items():
+        value = round(float(value), 2)
+        topic = topic_base + metric_name
+        if not force and not should_publish(metric_name, value, last_published.get(topic), tick):
+            continue
+        last_published[topic] = (value, tick)
+        payload = {"timestamp": timestamp, "value": value}
+        client.publish(topic, json.dumps(payload))
+
+def run_shard(cluster_ids, label="Managed Resources", service="managed_resources", heartbeat=None):
+    clusters = build_clusters(cluster_ids)
+    execute_queue = Queue()
+
+    # topic -> (last published value, tick it was published at)
+    last_published = {}
+    tick = 0
+
+    # MQTT callback (handles incoming commands from the AI/Dashboard)
+    def on_execute_message(client, userdata, msg):
+        try:
+            command = json.loads(msg.payload.decode())
+            execute_queue.put(command)
+            print(f"[{label}] Queued command: {command}")
+        except Exception as e:
+            print(f"[{label}] Error queuing command: {e}")
+
+    # MQTT connection setup with retry logic
+    # Each shard has its own connection and only subscribes to the commands of its clusters
+    while True:
+        try:
+            client = mqtt.Client()
+            client.username_pw_set(MQTT_USER, MQTT_PASSWORD)
+            client.connect(MQTT_BROKER, MQTT_PORT, 60)
+            for cid in cluster_ids:
+                topic = f"{EXECUTE_TOPIC}/cluster_{cid}"
+                client.subscribe(topic)
+                client.message_callback_add(topic, on_execute_message)
+            profiling.attach(client, service)
+            client.loop_start()
+            print(f"[{label}] MQTT ready")
+            break
+        except Exception as e:
+            print(f"[{label}] MQTT not ready: {e}")
+            # Waiting for the broker is progress too: the supervisor must not restart us for it
+            if heartbeat is not None:
+                heartbeat.value = time.time()
+            time.sleep(2)
+
+    print(f"[{label}] Started with clusters {sorted(cluster_ids)}")
+
+    # Main simulation loop
+    while True:
+        tick_start = time.time()
+
+        # 1. Process received commands
+        received = execute_queue.qsize()
+        command_lag = 0.0
+        while not execute_queue.empty():
+            command = execute_queue.get()
+            command_lag = max(command_lag, time.time() - command.get("timestamp", time.time()))
+            cluster_id = command.get("cluster")
+            container_name = command.get("container")
+
+            cluster = clusters.get(cluster_id)
+            if not cluster:
+                print(f"[{label}] Cluster {cluster_id} not found")
+                continue
+
+            action_payload = {
+                "action": command.get("action"),
+                "container": container_name
+            }
+
+            executed = cluster.execute_action(action_payload)
+
+            if executed:
+                print(f"[{label}] Executed: {action_payload}")
+                # Immediate publish after state change to improve UI responsiveness
+                container = next((c for c in cluster.containers if c.name == container_name), None)
+                if container:
+                    publish_container(client, cluster, container, time.time(), last_published, tick, force=True)
+            else:
+                print(f"[{label}] Action failed: {action_payload}")
+
+        # 2. Update all containers metrics
+        for cluster in clusters.values():
+            cluster.update_state()
+
+        # 3. Periodic telemetry publishing via MQTT (only values outside their deadband)
+        tick += 1
+        timestamp = time.time()
+        for cluster in clusters.values():
+            for container in cluster.containers:
+                publish_container(client, cluster, container, timestamp, last_published, tick)
+
+        # 4. Heartbeat for the executor, which holds back commands for our clusters while we are saturated.
+        # Backlog is real lateness: commands applied too long after they were sent, or a tick
+        # whose work alone takes longer than the publish interval (the next commands will be late)
+        tick_work = time.time() - tick_start
+        flow_control.publish_status(
+            client, service,
+            command_lag > MAX_COMMAND_LAG or tick_work > PUBLISH_INTERVAL,
+            queue_depth=execute_queue.qsize(),
+            received=received,
+            lag=round(command_lag, 2),
+            tick_work=round(tick_work, 3),
+            # Comma separated string: Telegraf drops it instead of flattening a JSON array into fields
+            clusters=",".join(str(cid) for cid in sorted(cluster_ids))
+        )
+
+        # 5. Tell the supervisor this shard is still making progress
+        if heartbeat is not None:
+            heartbeat.value = time.time()
+
+        time.sleep(PUBLISH_INTERVAL)
+
+def _shard_main(shard_id, cluster_ids, heartbeat):
+    run_shard(
+        cluster_ids,
+        label=f"Managed Resources shard {shard_id}",
+        service=f"managed_resources/shard_{shard_id}",
+        heartbeat=heartbeat
     )
-    for cid in range(NUM_CLUSTERS)
-}
 
-execute_queue = Queue()
+def start_shard(shard_id, cluster_ids):
+    heartbeat = multiprocessing.Value("d", time.time())
+    process = multiprocessing.Process(
+        target=_shard_main,
+        args=(shard_id, cluster_ids, heartbeat),
+        name=f"shard-{shard_id}",
+        daemon=True
+    )
+    process.start()
+    return process, heartbeat
+
+def supervise(num_shards):
+    # Round-robin split: cluster i goes to shard i % num_shards
+    assignments = {
+        shard_id: [cid for cid in range(NUM_CLUSTERS) if cid % num_shards == shard_id]
+        for shard_id in range(num_shards)
+    }
+    shards = {shard_id: start_shard(shard_id, cids) for shard_id, cids in assignments.items()}
+    print(f"[Managed Resources] Supervisor started {num_shards} shards: {assignments}")
 
-# MQTT callback (handles incoming commands from the AI/Dashboard)
-def on_execute_message(client, userdata, msg):
-    try:
-        command = json.loads(msg.payload.decode())
-        execute_queue.put(command)
-        print(f"[Managed Resources] Queued command: {command}")
-    except Exception as e:
-        print(f"[Managed Resources] Error queuing command: {e}")
-
-# MQTT connection setup with retry logic
-while True:
     try:
-        client = mqtt.Client()
-        client.username_pw_set(MQTT_USER, MQTT_PASSWORD)
-        client.connect(MQTT_BROKER, MQTT_PORT, 60)
-        client.subscribe(EXECUTE_TOPIC)
-        client.message_callback_add(EXECUTE_TOPIC, on_execute_message)
-        client.loop_start() 
-        print("[Managed Resources] MQTT ready")
-        break
-    except Exception as e:
-        print(f"[Managed Resources] MQTT not ready: {e}")
-        time.sleep(2)
-
-print("[Managed Resources] Started")
-
-# Main simulation loop
-while True:
-    # 1. Process received commands
-    while not execute_queue.empty():
-        command = execute_queue.get()
-        cluster_id = command.get("cluster")
-        container_name = command.get("container")
-
-        cluster = clusters.get(cluster_id)
-        if not cluster:
-            print(f"[Managed Resources] Cluster {cluster_id} not found")
-            continue
+        while True:
+            time.sleep(PUBLISH_INTERVAL)
+            now = time.time()
+            for shard_id, (process, heartbeat) in shards.items():
+                if not process.is_alive():
+                    print(f"[Managed Resources] Shard {shard_id} exited (code {process.exitcode}). Restarting...")
+                elif now - heartbeat.value > SHARD_HEALTH_TIMEOUT:
+                    print(f"[Managed Resources] Shard {shard_id} unresponsive for {now - heartbeat.value:.0f}s. Restarting...")
+                    process.terminate()
+                    process.join(5)
+                    # SIGTERM cannot interrupt a shard stuck in C code: make sure it is gone
+                    # before its clusters are handed to a replacement
+                    if process.is_alive():
+                        process.kill()
+                        process.join()
+                else:
+                    continue
+                shards[shard_id] = start_shard(shard_id, assignments[shard_id])
+    finally:
+        for process, _ in shards.values():
+            process.terminate()
 
-        action_payload = {
-            "action": command.get("action"),
-            "container": container_name
-        }
+if __name__ == "__main__":
+    # Docker stops the container with SIGTERM: exit cleanly so the shards are terminated too
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
 
-        executed = cluster.execute_action(action_payload)
-
-        if executed:
-            print(f"[Managed Resources] Executed: {action_payload}")
-            # Immediate publish after state change to improve UI responsiveness
-            container = next((c for c in cluster.containers if c.name == container_name), None)
-            if container:
-                timestamp = time.time()
-                topic_base = f"AIops/metrics/cluster_{cluster.cluster_id}/container_{container.name}/"
-                for metric_name, value in container.metrics.items():
-                    payload = {"timestamp": timestamp, "value": round(float(value), 2)}
-                    client.publish(topic_base + metric_name, json.dumps(payload))
-        else:
-            print(f"[Managed Resources] Action failed: {action_payload}")
-
-    # 2. Update all containers metrics
-    for cluster in clusters.values():
-        cluster.update_state()
-
-    # 3. Periodic telemetry publishing via MQTT
-    timestamp = time.time()
-    for cluster in clusters.values():
-        for container in cluster.containers:
-            topic_base = f"AIops/metrics/cluster_{cluster.cluster_id}/container_{container.name}/"
-            for metric_name, value in container.metrics.items():
-                payload = {"timestamp": timestamp, "value": round(float(value), 2)}
-                client.publish(topic_base + metric_name, json.dumps(payload))
-
-    time.sleep(PUBLISH_INTERVAL)
\ No newline at end of file
+    if SIMULATOR_SHARDS > 1:
+        supervise(SIMULATOR_SHARDS)
+    else:
+        run_shard(list(range(NUM_CLUSTERS)))
@@ -47,6 +47,8 @@ PLANNER_LLM_TOPIC = "AIops/planner_llm_response"
 
 # FIFO Queue (max size 10 to prevent memory overflow)
 llm_queue = queue.Queue(maxsize=10)
+# Requests dropped because the queue was full, reported in the planner heartbeat
+dropped_requests = 0
 
 # MQTT setup
 mqtt_client = mqtt.Client()
@@ -129,15 +131,25 @@ def _process_llm_request(data):
 
 
 # Start the worker thread once
-worker_thread = threading.Thread(target=_worker_loop, daemon=True)
+worker_thread = threading.Thread(target=_worker_loop, name="llm_service", daemon=True)
 worker_thread.start()
 
 
-# Public Method (Producer)
+# Public Methods (Producer)
+def queue_depth():
+    return llm_queue.qsize()
+
+def queue_capacity():
+    return llm_queue.maxsize
+
 def send_to_llm(data):
-    # Non-blocking put. If queue is full, drop the request.
+    # Non-blocking put. If queue is full, drop the request and count it.
+    global dropped_requests
     try:
         llm_queue.put(data, block=False)
         print(f"[Planner LLM Service] Request added to queue. Current size: {llm_queue.qsize()}")
+        return True
     except queue.Full:
-        print("[Planner LLM Service] Queue is full (max 10). Dropping request.")
\ No newline at end of file
+        dropped_requests += 1
+        print(f"[Planner LLM Service] Queue is full (max 10). Dropping request ({dropped_requests} dropped so far).")
+        return False
\ No newline at end of file
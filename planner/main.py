@@ -2,7 +2,10 @@ import os
 import time
 import json
 import requests
+import threading
 import configparser
+import profiling
+import flow_control
 import llm_service
 import paho.mqtt.client as mqtt
 
@@ -22,6 +25,15 @@ OUTPUT_TOPIC = "AIops/planner"
 MODEL_NAME = os.environ.get("MODEL_NAME")
 MODEL_URL = os.environ.get("MODEL_URL")
 
+# Flow control settings
+STATUS_TIMEOUT = config.getint("flow_control", "status_timeout", fallback=30)
+MAX_REPORT_AGE = config.getint("flow_control", "max_report_age", fallback=30)
+LLM_QUEUE_HIGH_WATERMARK = config.getint("flow_control", "llm_queue_high_watermark", fallback=8)
+STATUS_INTERVAL = 5
+
+# Counters reported in the planner heartbeat
+flow_stats = {"lag": 0.0, "lag_at": 0.0, "stale_reports": 0, "skipped_llm": 0}
+
 try:
     ENABLED_METRICS = [m.strip() for m in config["general"]["metrics"].split(",")]
     print(f"[Planner] Monitoring metrics: {ENABLED_METRICS}")
@@ -49,6 +61,17 @@ def on_message(client, userdata, msg):
         payload = json.loads(msg.payload.decode())
         report = payload.get("anomalies", {})
 
+        # Reports are handled as they arrive, so this only trips on a broker backlog (e.g. after a reconnect).
+        # The report timestamp is forwarded with the plan, so the executor checks the end-to-end age.
+        report_timestamp = payload.get("timestamp", time.time())
+        lag = time.time() - report_timestamp
+        flow_stats["lag"] = round(lag, 2)
+        flow_stats["lag_at"] = time.time()
+        if lag > MAX_REPORT_AGE:
+            flow_stats["stale_reports"] += 1
+            print(f"[Planner] Dropping stale report ({lag:.1f}s old)")
+            return
+
         if not report:
             return
 
@@ -83,10 +106,16 @@ def on_message(client, userdata, msg):
                 OUTPUT_TOPIC,
                 json.dumps({
                     "timestamp": time.time(),
+                    "report_timestamp": report_timestamp,
                     "actions": actions
                 })
             )
-            llm_service.send_to_llm(actions) 
+            # The explanation is optional: skip it rather than piling up work on a saturated LLM
+            if llm_service.queue_depth() >= LLM_QUEUE_HIGH_WATERMARK:
+                flow_stats["skipped_llm"] += 1
+                print(f"[Planner] LLM queue saturated ({llm_service.queue_depth()}). Skipping LLM submission.")
+            else:
+                llm_service.send_to_llm(actions)
         else:
             # If all the dominant metrics were 'normal', actions are not required
             print("[Planner] System status: ALL NORMAL. No consolidation actions required.")
@@ -94,6 +123,29 @@ def on_message(client, userdata, msg):
     except Exception as e:
         print(f"[Planner] Error processing message: {e}")
 
+# Heartbeat for the analyzer, published from its own thread so it keeps going while Ollama is still loading
+def _status_loop():
+    while True:
+        # The lag of the last report only describes the present for a while: without new reports it expires
+        if time.time() - flow_stats["lag_at"] > MAX_REPORT_AGE:
+            flow_stats["lag"] = 0.0
+
+        # Only the planning path counts towards saturation. The LLM explanation is optional and
+        # already shed above its watermark, so its pressure is reported but not acted upon
+        depth = llm_service.queue_depth()
+        flow_control.publish_status(
+            client, "planner",
+            flow_stats["lag"] > MAX_REPORT_AGE,
+            llm_saturated=int(depth >= LLM_QUEUE_HIGH_WATERMARK),
+            queue_depth=depth,
+            queue_capacity=llm_service.queue_capacity(),
+            lag=flow_stats["lag"],
+            stale_reports=flow_stats["stale_reports"],
+            skipped_llm=flow_stats["skipped_llm"],
+            dropped_llm=llm_service.dropped_requests
+        )
+        time.sleep(STATUS_INTERVAL)
+
 # MQTT and Ollama setup
 while True:
     try:
@@ -102,6 +154,8 @@ while True:
         client.connect(MQTT_BROKER, MQTT_PORT, 60)
         client.subscribe(INPUT_TOPIC)
         client.on_message = on_message
+        # The LLM worker runs in this process, so its thread is profiled from here too
+        profiling.attach(client, "planner")
         client.loop_start()
         print("[Planner] MQTT ready")
         break
@@ -109,6 +163,9 @@ while True:
         print(f"[Planner] MQTT not ready: {e}")
         time.sleep(2)
 
+status_thread = threading.Thread(target=_status_loop, name="flow_status", daemon=True)
+status_thread.start()
+
 payload_ping = {"model": MODEL_NAME, "prompt": "ping", "stream": False}
 while True:
     try:
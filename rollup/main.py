@@ -0,0 +1,263 @@
+import os
+import sys
+import time
+import signal
+import configparser
+from datetime import datetime, timezone
+from influxdb_client import InfluxDBClient, Point, WritePrecision, WriteOptions
+
+# Config parsing
+config = configparser.ConfigParser(interpolation=None)
+config.read("config.ini")
+
+# Environment Variables
+INFLUX_URL = os.environ.get("INFLUXDB_URL")
+INFLUX_TOKEN = os.environ.get("INFLUXDB_TOKEN")
+INFLUX_ORG = os.environ.get("INFLUXDB_ORG")
+INFLUX_BUCKET = os.environ.get("INFLUXDB_BUCKET")
+
+RAW_MEASUREMENT = "mqtt_consumer"
+
+# Rollup settings (all optional, the [rollup] section can be omitted)
+ROLLUP_MEASUREMENT = config.get("rollup", "measurement", fallback="mqtt_consumer_rollup")
+ROLLUP_INTERVAL = config.getint("rollup", "interval", fallback=60)
+# Seconds we wait after a minute closes before reading it, so Telegraf has flushed it
+ROLLUP_LAG = config.getint("rollup", "lag", fallback=30)
+# How far back we go when no rollup has been written yet
+ROLLUP_BACKFILL_HOURS = config.getint("rollup", "backfill_hours", fallback=24)
+
+PUBLISH_INTERVAL = config.getint("general", "publish_interval", fallback=10)
+TELEGRAF_FLUSH_INTERVAL = config.getint("general", "telegraf_flush_interval", fallback=10)
+
+# With deadband publishing a value holds until the next point, but only for as long as its
+# heartbeat promises one: past that (same margin as the analyzer) the series is considered dead
+STALE_AFTER = {}
+for section_name in config.sections():
+    if section_name.startswith("metric_"):
+        heartbeat_ticks = config.getint(section_name, "heartbeat_ticks", fallback=1)
+        STALE_AFTER[section_name[len("metric_"):]] = (heartbeat_ticks + 2) * PUBLISH_INTERVAL + TELEGRAF_FLUSH_INTERVAL
+DEFAULT_STALE_AFTER = 3 * PUBLISH_INTERVAL + TELEGRAF_FLUSH_INTERVAL
+MAX_STALE_AFTER = max(STALE_AFTER.values(), default=DEFAULT_STALE_AFTER)
+
+MINUTE = 60
+HOUR = 3600
+
+def floor_to(ts: int, step: int) -> int:
+    return ts - (ts % step)
+
+def to_rfc3339(ts: int) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def split_segments(events: list, start: float, stop: float, stale_after: float) -> dict:
+    # events: [(epoch_seconds, value), ...] sorted by time, the first one may be the value
+    # carried over from before `start`. Each value holds until the next event (or `stale_after`).
+    # Returns { minute_start: [(value, seconds), ...] } covering [start, stop).
+    minutes = {}
+    for i, (ts, value) in enumerate(events):
+        next_ts = events[i + 1][0] if i + 1 < len(events) else stop
+        begin = max(ts, start)
+        end = min(next_ts, ts + stale_after, stop)
+        while begin < end:
+            minute_start = int(floor_to(begin, MINUTE))
+            piece_end = min(end, minute_start + MINUTE)
+            minutes.setdefault(minute_start, []).append((value, piece_end - begin))
+            begin = piece_end
+    return minutes
+
+def summarize(segments: list) -> dict:
+    # Time-weighted min/mean/max and 95th percentile: a value counts for as long as it held,
+    # so a stable series reporting only on heartbeats is not outweighed by a noisy burst
+    total = sum(duration for _, duration in segments)
+    ordered = sorted(segments)
+    p95 = ordered[-1][0]
+    elapsed = 0.0
+    for value, duration in ordered:
+        elapsed += duration
+        if elapsed >= 0.95 * total:
+            p95 = value
+            break
+    return {
+        "min": float(ordered[0][0]),
+        "mean": float(sum(value * duration for value, duration in segments) / total),
+        "max": float(ordered[-1][0]),
+        "p95": float(p95)
+    }
+
+def build_point(window: str, series: tuple, start: int, segments: list, count: int) -> Point:
+    cluster, container, metric = series
+    point = (
+        Point(ROLLUP_MEASUREMENT)
+        .tag("window", window)
+        .tag("cluster", cluster)
+        .tag("container", container)
+        .tag("metric", metric)
+        .time(start, WritePrecision.S)
+    )
+    for field, value in summarize(segments).items():
+        point = point.field(field, value)
+    # Raw points received in the window
+    return point.field("count", count)
+
+def load_watermark(query_api):
+    # The 1h rollups are the slowest to close, so the newest one tells us where to resume.
+    # Everything after it is re-read once to rebuild the open hour; rewriting the
+    # 1m points of that hour is harmless because they land on the same series and timestamp.
+    query = f'''
+    from(bucket: "{INFLUX_BUCKET}")
+    |> range(start: -{ROLLUP_BACKFILL_HOURS + 1}h)
+    |> filter(fn: (r) =>
+        r._measurement == "{ROLLUP_MEASUREMENT}" and
+        r.window == "1h" and
+        r._field == "count"
+    )
+    |> group()
+    |> max(column: "_time")
+    '''
+    try:
+        tables = query_api.query(query)
+        for table in tables:
+            for record in table.records:
+                return int(record.get_time().timestamp()) + HOUR
+    except Exception as e:
+        print(f"[Rollup] Error loading watermark: {e}")
+    return floor_to(int(time.time()), HOUR) - ROLLUP_BACKFILL_HOURS * HOUR
+
+def read_raw(query_api, start: int, stop: int) -> dict:
+    # Returns { (cluster, container, metric): [(epoch_seconds, value), ...] } sorted by time
+    samples = {}
+    query = f'''
+    from(bucket: "{INFLUX_BUCKET}")
+    |> range(start: {to_rfc3339(start)}, stop: {to_rfc3339(stop)})
+    |> filter(fn: (r) =>
+        r._measurement == "{RAW_MEASUREMENT}" and
+        r._field == "value"
+    )
+    |> keep(columns: ["_time", "_value", "cluster", "container", "metric"])
+    |> sort(columns: ["_time"])
+    '''
+    for record in query_api.query_stream(query):
+        value = record.get_value()
+        metric_name = record.values.get("metric")
+        if value is None or not metric_name:
+            continue
+        series = (record["cluster"], record["container"], metric_name)
+        samples.setdefault(series, []).append((record.get_time().timestamp(), float(value)))
+    return samples
+
+# Earliest rollup timestamp of every batch the write API gave up on (filled from its writer thread)
+failed_writes = []
+
+def on_write_error(conf, data, exception):
+    # data is line protocol with second precision: the timestamp is the last token of each line
+    lines = data.decode() if isinstance(data, bytes) else str(data)
+    timestamps = [int(line.rsplit(" ", 1)[-1]) for line in lines.splitlines() if line.strip()]
+    print(f"[Rollup] Write of {len(timestamps)} rollup points failed: {exception}")
+    if timestamps:
+        failed_writes.append(min(timestamps))
+
+def restart_from(ts: int):
+    # Rebuilds the rollup state from the start of the hour containing `ts`:
+    # returns watermark, hour start, hour segments, hour counts and carried values
+    start = floor_to(ts, HOUR)
+    carried = {}
+    try:
+        for series, series_samples in read_raw(query_api, start - MAX_STALE_AFTER, start).items():
+            carried[series] = series_samples[-1]
+    except Exception as e:
+        print(f"[Rollup] Error loading last values: {e}")
+    return start, start, {}, {}, carried
+
+# Connection Setup
+while True:
+    try:
+        influx_client = InfluxDBClient(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG)
+        if influx_client.health().status == "pass":
+            query_api = influx_client.query_api()
+            # Batched, asynchronous writes: points are flushed in the background
+            write_api = influx_client.write_api(
+                write_options=WriteOptions(
+                    batch_size=500,
+                    flush_interval=10_000
+                ),
+                error_callback=on_write_error
+            )
+            print("[Rollup] InfluxDB ready")
+            break
+    except Exception as e:
+        print(f"[Rollup] InfluxDB not ready: {e}")
+        time.sleep(3)
+
+# Watermark: every raw point before it has already been folded into a rollup.
+# hour_segments/hour_counts: (value, seconds) segments and raw point counts of the hour being built.
+# carried: last point of every series, carried forward into the next minutes.
+watermark, hour_start, hour_segments, hour_counts, carried = restart_from(load_watermark(query_api))
+
+print(f"[Rollup] Started. Resuming from {to_rfc3339(watermark)}, interval: {ROLLUP_INTERVAL}s")
+
+# Docker stops the container with SIGTERM: exit through the finally block so queued points are flushed
+signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+try:
+    while True:
+        # A batch was lost: go back to the start of its hour, the rewritten points overwrite themselves
+        if failed_writes:
+            rewind_to = min(failed_writes)
+            failed_writes.clear()
+            if rewind_to < watermark:
+                print(f"[Rollup] Rewinding to {to_rfc3339(floor_to(rewind_to, HOUR))} after a failed write")
+                watermark, hour_start, hour_segments, hour_counts, carried = restart_from(rewind_to)
+
+        ready = floor_to(int(time.time()) - ROLLUP_LAG, MINUTE)
+
+        # Catch up at most one hour per query, so a long backfill never loads everything at once
+        while watermark < ready:
+            chunk_end = min(floor_to(watermark, HOUR) + HOUR, ready)
+            try:
+                samples = read_raw(query_api, watermark, chunk_end)
+            except Exception as e:
+                print(f"[Rollup] Error querying InfluxDB: {e}")
+                break
+
+            points = []
+            for series in set(samples) | set(carried):
+                series_samples = samples.get(series, [])
+                events = ([carried[series]] if series in carried else []) + series_samples
+                stale_after = STALE_AFTER.get(series[2], DEFAULT_STALE_AFTER)
+                minutes = split_segments(events, watermark, chunk_end, stale_after)
+
+                counts = {}
+                for ts, _ in series_samples:
+                    minute_start = int(floor_to(ts, MINUTE))
+                    counts[minute_start] = counts.get(minute_start, 0) + 1
+
+                for minute_start, segments in minutes.items():
+                    points.append(build_point("1m", series, minute_start, segments, counts.get(minute_start, 0)))
+                    hour_segments.setdefault(series, []).extend(segments)
+                hour_counts[series] = hour_counts.get(series, 0) + len(series_samples)
+
+                if series_samples:
+                    carried[series] = series_samples[-1]
+                elif carried[series][0] + stale_after < chunk_end:
+                    # Dead series: stop carrying its last value
+                    del carried[series]
+
+            watermark = chunk_end
+
+            # The hour is closed: emit its rollup and start accumulating the next one
+            if watermark >= hour_start + HOUR:
+                for series, segments in hour_segments.items():
+                    points.append(build_point("1h", series, hour_start, segments, hour_counts.get(series, 0)))
+                print(f"[Rollup] Hour {to_rfc3339(hour_start)} closed for {len(hour_segments)} series")
+                hour_start = floor_to(watermark, HOUR)
+                hour_segments = {}
+                hour_counts = {}
+
+            if points:
+                write_api.write(bucket=INFLUX_BUCKET, org=INFLUX_ORG, record=points)
+                print(f"[Rollup] Queued {len(points)} rollup points up to {to_rfc3339(watermark)}")
+
+        time.sleep(ROLLUP_INTERVAL)
+finally:
+    write_api.close()
+    influx_client.close()
+    print("[Rollup] Pending rollup points flushed")